@@ -1,10 +1,18 @@
-"""Web build size report. Usage: python3 client/web_size.py [release]
+"""Web build size report.
+
+Usage: python3 client/web_size.py [release] [--quick | --full] [--no-gzip]
+                                  [--gzip-cache=PATH]
 
 Analyzes WASM binary sections and asset sizes for the web build.
 No hardcoded project names — discovers everything from the filesystem.
+
+Gzip sizes use level 6, as shipped. --quick (the default for interactive
+non-release runs) estimates at level 1 instead, which is much faster;
+--full forces level 6 on an interactive run without rebuilding.
 """
 
-import glob, gzip, os, struct, sys
+import glob, json, mmap, os, sys, zlib
+from concurrent.futures import ThreadPoolExecutor
 
 SECTION_NAMES = {
     0: "Custom", 1: "Type", 2: "Import", 3: "Function", 4: "Table",
@@ -12,38 +20,60 @@ SECTION_NAMES = {
     10: "Code", 11: "Data", 12: "DataCount",
 }
 MB = 1024 * 1024
+GZ_CHUNK = 128 * 1024
+CACHE_DIR = os.path.expanduser("~/.cache/wasm-fantasia")
+GZ_CACHE = os.path.join(CACHE_DIR, "gzsizes.json")
+SECTIONS_CACHE = os.path.join(CACHE_DIR, "sections.json")
 ASSETS_DIR = os.path.join(os.path.dirname(__file__), "assets")
 
 
-def read_leb128(f):
+def read_leb128(buf, pos):
+    """Decode an unsigned LEB128 at buf[pos], return (value, next_pos)."""
     val = shift = 0
     while True:
-        byte = f.read(1)[0]
+        byte = buf[pos]
+        pos += 1
         val |= (byte & 0x7F) << shift
         shift += 7
         if not (byte & 0x80):
-            return val
+            return val, pos
 
 
 def wasm_sections(path):
     """Parse WASM binary into {section_name: byte_size}."""
     sections = {}
+    if os.path.getsize(path) <= 8:  # empty or header-only (e.g. mid-build)
+        return sections
     with open(path, "rb") as f:
-        f.read(8)
-        while b := f.read(1):
-            sid, size = b[0], read_leb128(f)
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with mm:
+        pos, end = 8, len(mm)
+        while pos < end:
+            sid = mm[pos]
+            size, pos = read_leb128(mm, pos + 1)
             name = SECTION_NAMES.get(sid, f"?({sid})")
             if sid == 0:
-                raw = f.read(read_leb128(f))
+                cn_len, cn_pos = read_leb128(mm, pos)
+                raw = mm[cn_pos:cn_pos + cn_len]
                 cn = raw.decode("utf-8", errors="replace")
-                f.seek(size - len(raw) - 1, 1)
                 name = f"Custom({cn})"
-            else:
-                f.seek(size, 1)
+            pos += size
             sections[name] = sections.get(name, 0) + size
     return sections
 
 
+def cached_sections(path, cache):
+    """wasm_sections(path), reused from cache while mtime and size match."""
+    key = os.path.abspath(path)
+    stamp = [os.path.getmtime(path), os.path.getsize(path)]
+    hit = cache.get(key)
+    if hit and hit[:2] == stamp:
+        return hit[2]
+    sections = wasm_sections(path)
+    cache[key] = stamp + [sections]
+    return sections
+
+
 def find_wasm(pattern):
     """Find WASM files matching a glob pattern, return newest."""
     matches = glob.glob(pattern, recursive=True)
@@ -53,36 +83,97 @@ def find_wasm(pattern):
     return max(matches, key=os.path.getmtime) if matches else None
 
 
-def print_wasm(path, label):
+def print_wasm(path, label, gz, level, cache):
+    """gz is a Future for the gzipped size of path, or None to skip it."""
     if not path or not os.path.exists(path):
         return
-    sections = wasm_sections(path)
+    sections = cached_sections(path, cache)
     total = sum(sections.values())
     print(f"\n  {label} ({total / MB:.1f} MB)")
-    for name, size in sorted(sections.items(), key=lambda x: -x[1]):
-        if size / total < 0.005:
-            continue
+    # Drop sections under 0.5% before sorting; only the big few get a row.
+    threshold = total * 0.005
+    rows = [(n, sz) for n, sz in sections.items() if sz >= threshold]
+    for name, size in sorted(rows, key=lambda x: -x[1]):
         bar = "\u2588" * int(size * 30 / total)
         print(f"    {name:28s} {size / MB:6.1f} MB {bar}")
-    gz = len(gzip.compress(open(path, "rb").read(), compresslevel=6))
-    print(f"    {'gzip':28s} {gz / MB:6.1f} MB")
+    if gz:
+        print(f"    {f'gzip(L{level})':28s} {gz.result() / MB:6.1f} MB")
 
 
 def dir_size(path):
-    if not os.path.isdir(path):
-        return 0
-    return sum(
-        os.path.getsize(os.path.join(dp, f))
-        for dp, _, fns in os.walk(path) for f in fns
-    )
-
-
-def gz_file_size(path):
-    return len(gzip.compress(open(path, "rb").read(), 6))
+    total, stack = 0, [path]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                elif e.is_file():
+                    total += e.stat().st_size
+    return total
+
+
+def gz_len(path, level=6, chunk=GZ_CHUNK):
+    """Gzipped size of a file, streamed so the file is never held in memory."""
+    c = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip wrapper
+    total = 0
+    with open(path, "rb") as f:
+        while data := f.read(chunk):
+            total += len(c.compress(data))
+    return total + len(c.flush())
+
+
+def gz_file_size(path, level, cache):
+    """gz_len(path, level), reused from cache while mtime and size match."""
+    key = f"{os.path.abspath(path)}:L{level}"
+    stamp = [os.path.getmtime(path), os.path.getsize(path)]
+    hit = cache.get(key)
+    if hit and hit[:2] == stamp:
+        return hit[2]
+    gz = gz_len(path, level)
+    cache[key] = stamp + [gz]
+    return gz
+
+
+def load_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(path, cache):
+    """Best-effort write, via a temp file so a partial dump never lands."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(tmp, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"warning: could not write cache {path}: {e}", file=sys.stderr)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
 
 
 def main():
-    do_release = "release" in sys.argv[1:]
+    args = sys.argv[1:]
+    do_release = "release" in args
+    do_gzip = "--no-gzip" not in args
+    quick = "--quick" in args or (
+        sys.stdout.isatty() and not do_release and "--full" not in args
+    )
+    level = 1 if quick else 6
+    cache_path = next(
+        (a.split("=", 1)[1] for a in args if a.startswith("--gzip-cache=")),
+        GZ_CACHE,
+    )
 
     if do_release:
         print("Building release WASM...")
@@ -100,28 +191,60 @@ def main():
 
     # Dev WASM — bevy CLI puts these in target/wasm32-unknown-unknown/web/
     dev = find_wasm("target/wasm32-unknown-unknown/web/**/*.wasm")
-    print_wasm(dev, "Dev WASM")
-
     # Release WASM — bevy CLI bundles to target/bevy_web/
     release = find_wasm("target/bevy_web/**/*.wasm")
-    print_wasm(release, "Release WASM")
 
-    # Assets
-    print(f"\n  Assets")
     models_dir = os.path.join(ASSETS_DIR, "models")
+    models = []
     if os.path.isdir(models_dir):
-        for f in sorted(os.listdir(models_dir)):
-            if f.endswith((".glb", ".gltf")):
-                p = os.path.join(models_dir, f)
-                sz = os.path.getsize(p)
-                gz = gz_file_size(p)
-                print(f"    {f:28s} {sz / MB:5.1f} MB  (gzip {gz / MB:.1f} MB)")
+        models = [
+            (f, os.path.join(models_dir, f))
+            for f in sorted(os.listdir(models_dir))
+            if f.endswith((".glb", ".gltf"))
+        ]
+
+    # zlib releases the GIL while deflating, so compress everything at once
+    # and only block on each result when it's printed.
+    paths = [p for p in (dev, release) if p and os.path.exists(p)]
+    paths += [p for _, p in models]
+    gz_cache = load_cache(cache_path) if do_gzip else {}
+    sections_cache = load_cache(SECTIONS_CACHE)
+    sections_seen = dict(sections_cache)
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        futures = {}
+        if do_gzip:
+            futures = {
+                p: pool.submit(gz_file_size, p, level, gz_cache)
+                for p in paths
+            }
+
+        for path, label in [(dev, "Dev WASM"), (release, "Release WASM")]:
+            print_wasm(path, label, futures.get(path), level, sections_cache)
+
+        # Assets
+        print(f"\n  Assets")
+        for f, p in models:
+            sz = os.path.getsize(p)
+            if p not in futures:
+                print(f"    {f:28s} {sz / MB:5.1f} MB")
+                continue
+            gz = futures[p].result()
+            print(
+                f"    {f:28s} {sz / MB:5.1f} MB  "
+                f"(gzip(L{level}) {gz / MB:.1f} MB)"
+            )
 
     for name in ["audio", "fonts", "textures", "shaders"]:
         sz = dir_size(os.path.join(ASSETS_DIR, name))
         if sz > 1024:
             print(f"    {name + '/':28s} {sz / MB:5.1f} MB")
 
+    # Only touch disk when a section map was actually (re)parsed.
+    if sections_cache != sections_seen:
+        save_cache(SECTIONS_CACHE, sections_cache)
+    if do_gzip:
+        save_cache(cache_path, gz_cache)
+
 
 if __name__ == "__main__":
     main()